@@ -2,9 +2,12 @@ import pygame
 import sys
 import math
 import random
-from typing import Callable, Optional, Union
+from operator import itemgetter
+from typing import Callable, Optional
 import socket
-import pickle
+import select
+import struct
+from protocol import recv_msg, encode_name, encode_position, decode_players, MessageReader
 
 # ==============================================================================
 """
@@ -23,6 +26,7 @@ Classes:
     - CheckBox: A toggleable box for boolean options.
     - Slider: An interactive control to select a numeric value within a range.
     - TextInput: A field for users to enter text.
+    - GlyphAtlas: Pre-rendered glyph sheet used to build text surfaces with plain blits.
 """
 # --- Theme & Constants ---
 UI_THEME = {
@@ -44,90 +48,270 @@ UI_THEME = {
     "tooltip_alpha": 220,
 }
 
+def reload_theme() -> None:
+    """Binds the UI_THEME entries to module-level names used on the draw path.
+
+    Call again after editing UI_THEME; surfaces a widget has already cached keep their old colours.
+    """
+    global _FONT_NAME, _FONT_SIZE, _PANEL_COLOR, _LABEL_COLOR, _BORDER_COLOR, _BUTTON_COLOR_IDLE, _BUTTON_COLOR_HOVER, _BUTTON_COLOR_PRESSED
+    global _SLIDER_TRACK_COLOR, _SLIDER_HANDLE_COLOR, _CHECKBOX_COLOR, _CHECKBOX_CHECKMARK_COLOR, _TEXT_INPUT_BG_COLOR, _TEXT_INPUT_BORDER_ACTIVE, _TOOLTIP_BG_COLOR, _TOOLTIP_ALPHA
+    _FONT_NAME = UI_THEME["font_name"]
+    _FONT_SIZE = UI_THEME["font_size"]
+    _PANEL_COLOR = UI_THEME["panel_color"]
+    _LABEL_COLOR = UI_THEME["label_color"]
+    _BORDER_COLOR = UI_THEME["border_color"]
+    _BUTTON_COLOR_IDLE = UI_THEME["button_color_idle"]
+    _BUTTON_COLOR_HOVER = UI_THEME["button_color_hover"]
+    _BUTTON_COLOR_PRESSED = UI_THEME["button_color_pressed"]
+    _SLIDER_TRACK_COLOR = UI_THEME["slider_track_color"]
+    _SLIDER_HANDLE_COLOR = UI_THEME["slider_handle_color"]
+    _CHECKBOX_COLOR = UI_THEME["checkbox_color"]
+    _CHECKBOX_CHECKMARK_COLOR = UI_THEME["checkbox_checkmark_color"]
+    _TEXT_INPUT_BG_COLOR = UI_THEME["text_input_bg_color"]
+    _TEXT_INPUT_BORDER_ACTIVE = UI_THEME["text_input_border_active"]
+    _TOOLTIP_BG_COLOR = UI_THEME["tooltip_bg_color"]
+    _TOOLTIP_ALPHA = UI_THEME["tooltip_alpha"]
+
+reload_theme()
+
+class GlyphAtlas:
+    """Printable ASCII glyphs rendered once onto a single surface, so text can be built from blits."""
+    _atlases = {}
+    def __init__(self, font: pygame.font.Font, color: tuple):
+        self.font, self.color, self.height = font, color, font.get_height()
+        glyphs = [(chr(c), font.render(chr(c), True, color)) for c in range(32, 127)]
+        self.surf = pygame.Surface((sum(g.get_width() for _, g in glyphs), self.height), pygame.SRCALPHA)
+        self.surf.fill((*color, 0))
+        self.rects, x = {}, 0
+        for ch, glyph in glyphs:
+            self.surf.blit(glyph, (x, 0)); self.rects[ch] = pygame.Rect(x, 0, glyph.get_width(), self.height); x += glyph.get_width()
+        self.extra = {}
+    @classmethod
+    def get(cls, font: pygame.font.Font, color: tuple) -> "GlyphAtlas":
+        atlas = cls._atlases.get((font, color))
+        if atlas is None: atlas = cls._atlases[(font, color)] = cls(font, color)
+        return atlas
+    def _glyph(self, ch: str) -> tuple:
+        rect = self.rects.get(ch)
+        if rect is not None: return self.surf, rect
+        glyph = self.extra.get(ch)
+        if glyph is None: glyph = self.extra[ch] = self.font.render(ch, True, self.color)
+        return glyph, glyph.get_rect()
+    def render(self, text: str) -> pygame.Surface:
+        glyphs = [self._glyph(ch) for ch in text]
+        surf = pygame.Surface((sum(r.width for _, r in glyphs), self.height), pygame.SRCALPHA)
+        surf.fill((*self.color, 0)); x = 0
+        for src, rect in glyphs: surf.blit(src, (x, 0), rect); x += rect.width
+        return surf
+
+_FONT_CACHE = {}
+
+def get_font(name: str, size: int, bold: bool = False) -> pygame.font.Font:
+    """Returns a shared SysFont instance, opening each (name, size, bold) font only once."""
+    key = (name, size, bold)
+    font = _FONT_CACHE.get(key)
+    if font is None: font = _FONT_CACHE[key] = pygame.font.SysFont(name, size, bold=bold)
+    return font
+
+def _rounded_rect_surface(size: tuple, fill: tuple, border: tuple, radius: int) -> pygame.Surface:
+    """Renders a filled, 1px-bordered rounded rectangle onto its own transparent surface."""
+    surf = pygame.Surface(size, pygame.SRCALPHA)
+    pygame.draw.rect(surf, fill, surf.get_rect(), border_radius=radius)
+    if border: pygame.draw.rect(surf, border, surf.get_rect(), 1, border_radius=radius)
+    return surf
+
 class UIElement:
     """The foundational class for all UI components."""
+    __slots__ = ('rect', '_visible', 'hovered', 'tooltip_text', '_dirty', '_drawn_rect')
+    HANDLED_EVENTS = frozenset({pygame.MOUSEMOTION})
     def __init__(self, rect: pygame.Rect, tooltip: Optional[str] = None):
         self.rect = rect
-        self.visible = True
+        self._visible = True
         self.hovered = False
         self.tooltip_text = tooltip
+        self._dirty, self._drawn_rect = True, rect.copy()
+
+    @property
+    def visible(self) -> bool: return self._visible
+    @visible.setter
+    def visible(self, visible: bool) -> None:
+        if visible != self._visible: self._visible = visible; self._dirty = True
+
+    def bounds(self) -> pygame.Rect:
+        """The screen area this element paints into."""
+        return self.rect
 
     def handle_event(self, event: pygame.event.Event) -> None:
         if not self.visible:
             return
         if event.type == pygame.MOUSEMOTION:
-            self.hovered = self.rect.collidepoint(event.pos)
+            hovered = bool(self.rect.collidepoint(event.pos))
+            if hovered != self.hovered: self.hovered = hovered; self._dirty = True
 
     def update(self) -> None: pass
-    def draw(self, screen: pygame.Surface) -> None: pass
+    def draw(self, screen: pygame.Surface) -> None:
+        items = self.blit_items()
+        if items: screen.blits(items, doreturn=False)
+    def blit_items(self) -> Optional[list]:
+        """(surface, dest) pairs that fully draw this element, or None if it draws primitives in draw()."""
+        return None
 
 class UIManager:
     """Manages a collection of UI elements, handling events and drawing."""
+    EVENT_TYPES = (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.KEYDOWN)
     def __init__(self):
-        self.elements = []
+        self.elements, self._updatable = [], []
+        self._roots, self._root_rects, self._order, self._hot = [], [], {}, []
+        self._handlers = {event_type: [] for event_type in self.EVENT_TYPES}
         self.active_text_input = None
-        self.tooltip_font = pygame.font.SysFont(UI_THEME["font_name"], 14)
+        self.tooltip_font = get_font(_FONT_NAME, 14)
+        self._mouse_pos = pygame.mouse.get_pos()
+        self._full_redraw, self._tooltip_rect = True, None
+        self._hovered_with_tooltip = None
+        self._tooltip_text_cache, self._tooltip_bg_cache = {}, {}
 
     def add(self, element: UIElement) -> UIElement:
-        self.elements.append(element)
+        self._register(element); self._roots.append(element); self._root_rects.append(element.rect)
+        return element
+
+    def add_to(self, parent: "Panel", element: UIElement) -> UIElement:
+        """Adds an element grouped under a panel; it is only hit-tested while the pointer is inside the panel."""
+        self._register(element); parent.children.append(element)
         return element
 
+    def _register(self, element: UIElement) -> None:
+        self._order[element] = len(self.elements); self.elements.append(element)
+        for event_type in element.HANDLED_EVENTS: self._handlers[event_type].append(element)
+        if type(element).update is not UIElement.update: self._updatable.append(element)
+
+    def clear(self) -> None:
+        self.elements.clear(); self._updatable.clear(); self._roots.clear(); self._root_rects.clear(); self._order.clear(); self._hot = []
+        self.active_text_input = None; self._full_redraw = True; self._hovered_with_tooltip = None
+        self._handlers = {event_type: [] for event_type in self.EVENT_TYPES}
+
     def handle_events(self, event: pygame.event.Event) -> None:
+        if event.type == pygame.MOUSEMOTION:
+            # Only hit, previously hovered or dragging elements need the motion, in draw order.
+            self._mouse_pos = event.pos
+            hits = self._hit_test(event.pos)
+            hot, top = [], None
+            for element in sorted(hits.union(self._hot), key=self._order.__getitem__):
+                element.handle_event(event)
+                if (element.hovered or getattr(element, "is_dragging", False)) and element in self._order: hot.append(element)
+                if element.hovered and element.tooltip_text and element in hits: top = element
+            self._hot, self._hovered_with_tooltip = hot, top
+            return
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.active_text_input and not self.active_text_input.rect.collidepoint(event.pos):
                 self.active_text_input.is_active = False
                 self.active_text_input = None
-        for element in self.elements:
+        for element in self._handlers.get(event.type, ()):
             element.handle_event(event)
             if isinstance(element, TextInput) and element.is_active:
                 if self.active_text_input and self.active_text_input != element:
                     self.active_text_input.is_active = False
                 self.active_text_input = element
 
+    def _hit_test(self, pos: tuple) -> set:
+        """Returns the elements under pos, descending into a panel's children only when the panel itself is hit."""
+        probe, hits = pygame.Rect(pos, (1, 1)), set()
+        groups = [(self._roots, self._root_rects)]
+        while groups:
+            group, rects = groups.pop()
+            for i in probe.collidelistall(rects):
+                element = group[i]; hits.add(element)
+                if isinstance(element, Panel) and element.children: groups.append((element.children, [child.rect for child in element.children]))
+        return hits
+
+    def pump(self, events: list) -> None:
+        """Dispatches a frame's worth of events, skipping irrelevant types and superseded mouse motion."""
+        events = [event for event in events if event.type in self.EVENT_TYPES]
+        if not events: return
+        for i, event in enumerate(events):
+            if event.type == pygame.MOUSEMOTION and i + 1 < len(events) and events[i + 1].type == pygame.MOUSEMOTION: continue
+            self.handle_events(event)
+
     def update(self) -> None:
-        for element in self.elements:
+        for element in self._updatable:
             element.update()
 
-    def draw(self, screen: pygame.Surface) -> None:
+    def draw(self, screen: pygame.Surface, background: Optional[tuple] = None) -> list:
+        """Draws the UI and returns the list of screen rects that changed.
+
+        When a background colour is given, only the area covered by dirty elements and the
+        tooltip is cleared and repainted; otherwise every visible element is drawn.
+        """
+        top_hovered_element = self._hovered_with_tooltip
+        tooltip = self._layout_tooltip(screen, top_hovered_element) if top_hovered_element and top_hovered_element.hovered else None
+        if background is None or self._full_redraw:
+            if background is not None: screen.fill(background); self._full_redraw = False
+            region = screen.get_rect()
+        else:
+            dirty = [r for element in self.elements if element._dirty for r in (element._drawn_rect, element.bounds())]
+            if self._tooltip_rect: dirty.append(self._tooltip_rect)
+            if tooltip: dirty.append(tooltip[1])
+            if not dirty: return []
+            region = dirty[0].unionall(dirty[1:])
+            screen.set_clip(region); screen.fill(background)
+        batch = []
         for element in self.elements:
-            if element.visible:
-                element.draw(screen)
-        top_hovered_element = None
-        for element in reversed(self.elements):
-            if element.hovered and element.tooltip_text:
-                top_hovered_element = element
-                break
-        if top_hovered_element:
-            self._draw_tooltip(screen, top_hovered_element)
-
-    def _draw_tooltip(self, screen: pygame.Surface, element: UIElement) -> None:
-        if not element.tooltip_text: return
+            bounds = element.bounds()
+            if element.visible and bounds.colliderect(region):
+                items = element.blit_items()
+                if items is not None: batch.extend(items)
+                else:
+                    if batch: screen.blits(batch, doreturn=False); batch = []
+                    element.draw(screen)
+            element._dirty, element._drawn_rect = False, bounds.copy()
+        if batch: screen.blits(batch, doreturn=False)
+        if tooltip: self._draw_tooltip(screen, *tooltip)
+        self._tooltip_rect = tooltip[1] if tooltip else None
+        screen.set_clip(None)
+        return [region]
+
+    def _layout_tooltip(self, screen: pygame.Surface, element: UIElement) -> tuple:
         padding = 5
-        mouse_pos = pygame.mouse.get_pos()
-        text_surf = self.tooltip_font.render(element.tooltip_text, True, UI_THEME["label_color"])
+        mouse_pos = self._mouse_pos
+        text_surf = self._tooltip_text_cache.get(element.tooltip_text)
+        if text_surf is None:
+            text_surf = self._tooltip_text_cache[element.tooltip_text] = self.tooltip_font.render(element.tooltip_text, True, _LABEL_COLOR)
         tooltip_rect = text_surf.get_rect( topleft=mouse_pos, width=text_surf.get_width() + padding * 2, height=text_surf.get_height() + padding * 2)
         tooltip_rect.x += 15
         if tooltip_rect.right > screen.get_width(): tooltip_rect.right = screen.get_width()
         if tooltip_rect.bottom > screen.get_height(): tooltip_rect.bottom = screen.get_height()
-        bg_surf = pygame.Surface(tooltip_rect.size, pygame.SRCALPHA)
-        bg_surf.fill((*UI_THEME["tooltip_bg_color"], UI_THEME["tooltip_alpha"]))
+        return text_surf, tooltip_rect
+
+    def _draw_tooltip(self, screen: pygame.Surface, text_surf: pygame.Surface, tooltip_rect: pygame.Rect) -> None:
+        padding = 5
+        bg_surf = self._tooltip_bg_cache.get(tooltip_rect.size)
+        if bg_surf is None:
+            bg_surf = self._tooltip_bg_cache[tooltip_rect.size] = pygame.Surface(tooltip_rect.size, pygame.SRCALPHA)
+            bg_surf.fill((*_TOOLTIP_BG_COLOR, _TOOLTIP_ALPHA))
         screen.blit(bg_surf, tooltip_rect)
-        pygame.draw.rect(screen, UI_THEME["border_color"], tooltip_rect, 1)
+        pygame.draw.rect(screen, _BORDER_COLOR, tooltip_rect, 1)
         screen.blit(text_surf, (tooltip_rect.x + padding, tooltip_rect.y + padding))
 
 class Panel(UIElement):
+    __slots__ = ('_color', 'border_width', 'children')
     def __init__(self, rect: pygame.Rect, color: tuple, border_width: int = 1, **kwargs):
         super().__init__(rect, **kwargs)
-        self.color = color
+        self._color = color
         self.border_width = border_width
+        self.children = []
+    @property
+    def color(self) -> tuple: return self._color
+    @color.setter
+    def color(self, color: tuple) -> None:
+        if color != self._color: self._color = color; self._dirty = True
     def draw(self, screen: pygame.Surface) -> None:
         pygame.draw.rect(screen, self.color, self.rect)
         if self.border_width > 0:
-            pygame.draw.rect(screen, UI_THEME["border_color"], self.rect, self.border_width)
+            pygame.draw.rect(screen, _BORDER_COLOR, self.rect, self.border_width)
 
 class Label(UIElement):
-    def __init__(self, pos: tuple, text: str, font_size: int = UI_THEME["font_size"], color: tuple = UI_THEME["label_color"], **kwargs):
-        self.font = pygame.font.SysFont(UI_THEME["font_name"], font_size)
+    __slots__ = ('font', 'color', '_text', 'text_surf')
+    def __init__(self, pos: tuple, text: str, font_size: int = _FONT_SIZE, color: tuple = _LABEL_COLOR, **kwargs):
+        self.font = get_font(_FONT_NAME, font_size)
         self.color = color
         self._text = text
         self.text_surf = self.font.render(self._text, True, self.color)
@@ -140,104 +324,134 @@ class Label(UIElement):
         if self._text != new_text:
             self._text = new_text
             self.text_surf = self.font.render(self._text, True, self.color)
-            self.rect.size = self.text_surf.get_size()
-    def draw(self, screen: pygame.Surface) -> None:
-        screen.blit(self.text_surf, self.rect)
+            self.rect.size = self.text_surf.get_size(); self._dirty = True
+    def blit_items(self) -> list:
+        return [(self.text_surf, self.rect)]
 
 class Button(UIElement):
+    __slots__ = ('text', 'on_click', 'font', 'is_pressed', 'colors', 'text_surf', 'text_rect', '_cached', '_cached_size', '_state_surfs')
+    HANDLED_EVENTS = frozenset({pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP})
     def __init__(self, rect: pygame.Rect, text: str, on_click: Optional[Callable] = None, **kwargs):
         super().__init__(rect, **kwargs)
         self.text = text
         self.on_click = on_click
-        self.font = pygame.font.SysFont(UI_THEME["font_name"], UI_THEME["font_size"], bold=True)
+        self.font = get_font(_FONT_NAME, _FONT_SIZE, bold=True)
         self.is_pressed = False
-        self.colors = {"idle": UI_THEME["button_color_idle"], "hover": UI_THEME["button_color_hover"], "pressed": UI_THEME["button_color_pressed"]}
-        self.text_surf = self.font.render(text, True, UI_THEME["label_color"])
+        self.colors = {"idle": _BUTTON_COLOR_IDLE, "hover": _BUTTON_COLOR_HOVER, "pressed": _BUTTON_COLOR_PRESSED}
+        self.text_surf = self.font.render(text, True, _LABEL_COLOR)
         self.text_rect = self.text_surf.get_rect(center=self.rect.center)
+        self._cached, self._cached_size = {}, None
+    def _build_cache(self) -> None:
+        """Pre-renders the background, border and label for each visual state at the current size."""
+        self._cached_size = self.rect.size
+        text_pos = self.text_surf.get_rect(center=(self.rect.width // 2, self.rect.height // 2))
+        for state, color in self.colors.items():
+            surf = _rounded_rect_surface(self.rect.size, color, _BORDER_COLOR, 5)
+            surf.blit(self.text_surf, text_pos); self._cached[state] = surf
+        # Resolve (is_pressed, hovered) to a surface once so drawing is a single lookup.
+        self._state_surfs = {(pressed, hovered): self._cached["pressed" if pressed else "hover" if hovered else "idle"] for pressed in (False, True) for hovered in (False, True)}
     def handle_event(self, event: pygame.event.Event) -> None:
         super().handle_event(event)
         if not self.visible or not self.on_click: return
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.hovered:
-            self.is_pressed = True
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.hovered and not self.is_pressed:
+            self.is_pressed, self._dirty = True, True
         elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.hovered and self.is_pressed:
             self.on_click()
-            self.is_pressed = False
-        elif event.type == pygame.MOUSEMOTION and not self.hovered:
-            self.is_pressed = False
-    def draw(self, screen: pygame.Surface) -> None:
-        color = self.colors["idle"]
-        if self.is_pressed: color = self.colors["pressed"]
-        elif self.hovered: color = self.colors["hover"]
-        pygame.draw.rect(screen, color, self.rect, border_radius=5)
-        pygame.draw.rect(screen, UI_THEME["border_color"], self.rect, 1, border_radius=5)
-        screen.blit(self.text_surf, self.text_rect)
+            self.is_pressed, self._dirty = False, True
+        elif event.type == pygame.MOUSEMOTION and not self.hovered and self.is_pressed:
+            self.is_pressed, self._dirty = False, True
+    def blit_items(self) -> list:
+        if self._cached_size != self.rect.size: self._build_cache()
+        return [(self._state_surfs[(self.is_pressed, bool(self.hovered))], self.rect)]
 
 class CheckBox(UIElement):
+    __slots__ = ('box_size', 'font', 'label_surf', 'box_rect', 'label_rect', '_checked', 'on_toggle', '_cached')
+    HANDLED_EVENTS = frozenset({pygame.MOUSEMOTION, pygame.MOUSEBUTTONUP})
     def __init__(self, pos: tuple, label: str, on_toggle: Optional[Callable[[bool], None]] = None, checked: bool = False, **kwargs):
         self.box_size = 16
-        self.font = pygame.font.SysFont(UI_THEME["font_name"], UI_THEME["font_size"])
-        self.label_surf = self.font.render(label, True, UI_THEME["label_color"])
+        self.font = get_font(_FONT_NAME, _FONT_SIZE)
+        self.label_surf = self.font.render(label, True, _LABEL_COLOR)
         width, height = self.box_size + 5 + self.label_surf.get_width(), self.box_size
         rect = pygame.Rect(pos[0], pos[1], width, height)
         super().__init__(rect, **kwargs)
         self.box_rect = pygame.Rect(pos[0], pos[1], self.box_size, self.box_size)
         self.label_rect = self.label_surf.get_rect(centery=self.box_rect.centery, left=self.box_rect.right + 5)
-        self.checked = checked
+        self._checked = checked
         self.on_toggle = on_toggle
+        self._cached = {}
+        for checked_state in (False, True):
+            for hovered in (False, True):
+                border_color = _TEXT_INPUT_BORDER_ACTIVE if hovered else _BORDER_COLOR
+                surf = _rounded_rect_surface(self.box_rect.size, _CHECKBOX_COLOR, border_color, 3)
+                if checked_state:
+                    points = [(3, self.box_size // 2), (self.box_size // 2 - 1, self.box_size - 4), (self.box_size - 3, 4)]
+                    pygame.draw.lines(surf, _CHECKBOX_CHECKMARK_COLOR, False, points, 2)
+                self._cached[(checked_state, hovered)] = surf
     def handle_event(self, event: pygame.event.Event) -> None:
         super().handle_event(event)
         if not self.visible: return
         if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.hovered:
             self.checked = not self.checked
             if self.on_toggle: self.on_toggle(self.checked)
-    def draw(self, screen: pygame.Surface) -> None:
-        pygame.draw.rect(screen, UI_THEME["checkbox_color"], self.box_rect, border_radius=3)
-        border_color = UI_THEME["text_input_border_active"] if self.hovered else UI_THEME["border_color"]
-        pygame.draw.rect(screen, border_color, self.box_rect, 1, border_radius=3)
-        if self.checked:
-            points = [(self.box_rect.left + 3, self.box_rect.centery), (self.box_rect.centerx - 1, self.box_rect.bottom - 4), (self.box_rect.right - 3, self.box_rect.top + 4)]
-            pygame.draw.lines(screen, UI_THEME["checkbox_checkmark_color"], False, points, 2)
-        screen.blit(self.label_surf, self.label_rect)
+    @property
+    def checked(self) -> bool: return self._checked
+    @checked.setter
+    def checked(self, checked: bool) -> None:
+        if checked != self._checked: self._checked = checked; self._dirty = True
+    def blit_items(self) -> list:
+        return [(self._cached[(bool(self.checked), bool(self.hovered))], self.box_rect), (self.label_surf, self.label_rect)]
 
 class Slider(UIElement):
+    __slots__ = ('min_val', 'max_val', '_value', 'on_change', 'is_dragging', 'handle_width', 'handle_rect', '_last_x_pos', '_track_surf', '_handle_surfs')
+    HANDLED_EVENTS = frozenset({pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP})
     def __init__(self, rect: pygame.Rect, min_val: float, max_val: float, on_change: Optional[Callable[[float], None]] = None, initial_val: Optional[float] = None, **kwargs):
         super().__init__(rect, **kwargs)
         self.min_val, self.max_val = min_val, max_val
-        self.value = initial_val if initial_val is not None else min_val
+        self._value = initial_val if initial_val is not None else min_val
         self.on_change = on_change
         self.is_dragging = False
         self.handle_width = 10
         self.handle_rect = pygame.Rect(0, 0, self.handle_width, self.rect.height)
-        self._update_handle_pos()
-    def _update_handle_pos(self) -> None:
-        ratio = (self.value - self.min_val) / (self.max_val - self.min_val)
+        self._update_handle_pos(); self._last_x_pos = None
+        self._track_surf = _rounded_rect_surface((self.rect.width, 6), _SLIDER_TRACK_COLOR, None, 3)
+        self._handle_surfs = {hot: _rounded_rect_surface(self.handle_rect.size, _TEXT_INPUT_BORDER_ACTIVE if hot else _SLIDER_HANDLE_COLOR, None, 3) for hot in (False, True)}
+    def bounds(self) -> pygame.Rect:
+        return self.rect.inflate(self.handle_width, 0)
+    @property
+    def value(self) -> float: return self._value
+    @value.setter
+    def value(self, value: float) -> None:
+        if value != self._value: self._value = value; self._update_handle_pos(); self._dirty = True
+    def _update_handle_pos(self, ratio: Optional[float] = None) -> None:
+        if ratio is None: ratio = (self.value - self.min_val) / (self.max_val - self.min_val)
         self.handle_rect.centerx = self.rect.x + ratio * self.rect.width
         self.handle_rect.centery = self.rect.centery
     def _update_value_from_pos(self, x_pos: int) -> None:
+        if x_pos == self._last_x_pos: return
+        self._last_x_pos = x_pos
         ratio = max(0.0, min(1.0, (x_pos - self.rect.x) / self.rect.width))
         new_value = self.min_val + ratio * (self.max_val - self.min_val)
         if self.value != new_value:
             self.value = new_value
             if self.on_change: self.on_change(self.value)
-        self._update_handle_pos()
     def handle_event(self, event: pygame.event.Event) -> None:
         super().handle_event(event)
         if not self.visible: return
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.hovered:
-            self.is_dragging = True
+            self.is_dragging, self._last_x_pos, self._dirty = True, None, True
             self._update_value_from_pos(event.pos[0])
-        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1: self.is_dragging = False
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.is_dragging: self.is_dragging, self._dirty = False, True
         elif event.type == pygame.MOUSEMOTION and self.is_dragging: self._update_value_from_pos(event.pos[0])
-    def draw(self, screen: pygame.Surface) -> None:
-        track_rect = self.rect.copy(); track_rect.height = 6; track_rect.centery = self.rect.centery
-        pygame.draw.rect(screen, UI_THEME["slider_track_color"], track_rect, border_radius=3)
-        handle_color = UI_THEME["text_input_border_active"] if self.is_dragging or self.hovered else UI_THEME["slider_handle_color"]
-        pygame.draw.rect(screen, handle_color, self.handle_rect, border_radius=3)
+    def blit_items(self) -> list:
+        return [(self._track_surf, (self.rect.x, self.rect.centery - 3)), (self._handle_surfs[bool(self.is_dragging or self.hovered)], self.handle_rect)]
 
 class TextInput(UIElement):
+    __slots__ = ('font', '_chars', '_text_cache', '_is_active', 'on_submit', 'cursor_visible', '_last_blink', '_rendered_text', '_rendered_surf', 'atlas')
+    HANDLED_EVENTS = frozenset({pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN})
     def __init__(self, rect: pygame.Rect, on_submit: Optional[Callable[[str], None]] = None, initial_text: str = "", **kwargs):
-        super().__init__(rect, **kwargs); self.font = pygame.font.SysFont(UI_THEME["font_name"], UI_THEME["font_size"])
-        self.text, self.is_active, self.on_submit = initial_text, False, on_submit; self.cursor_visible, self.cursor_timer = True, 0
+        super().__init__(rect, **kwargs); self.font = get_font(_FONT_NAME, _FONT_SIZE)
+        self.text, self._is_active, self.on_submit = initial_text, False, on_submit; self.cursor_visible, self._last_blink = True, pygame.time.get_ticks()
+        self._rendered_text, self._rendered_surf = None, None; self.atlas = GlyphAtlas.get(self.font, _LABEL_COLOR)
     def handle_event(self, event: pygame.event.Event) -> None:
         super().handle_event(event)
         if not self.visible: return
@@ -246,19 +460,36 @@ class TextInput(UIElement):
             if event.key == pygame.K_RETURN:
                 if self.on_submit: self.on_submit(self.text)
                 self.is_active = False
-            elif event.key == pygame.K_BACKSPACE: self.text = self.text[:-1]
-            else: self.text += event.unicode
+            elif event.key == pygame.K_BACKSPACE:
+                if self._chars: self._chars.pop(); self._text_cache = None; self._dirty = True
+            elif event.unicode: self._chars.append(event.unicode); self._text_cache = None; self._dirty = True
+    @property
+    def is_active(self) -> bool: return self._is_active
+    @is_active.setter
+    def is_active(self, active: bool) -> None:
+        # UIManager also deactivates inputs, so the redraw is marked here rather than at each call site.
+        if active != self._is_active: self._is_active = active; self._dirty = True
+    @property
+    def text(self) -> str:
+        if self._text_cache is None: self._text_cache = "".join(self._chars)
+        return self._text_cache
+    @text.setter
+    def text(self, new_text: str) -> None:
+        self._chars, self._text_cache, self._dirty = list(new_text), new_text, True
     def update(self) -> None:
-        self.cursor_timer += 1
-        if self.cursor_timer > 30: self.cursor_visible = not self.cursor_visible; self.cursor_timer = 0
+        if not self.is_active: return
+        now = pygame.time.get_ticks()
+        if now - self._last_blink > 500: self.cursor_visible = not self.cursor_visible; self._last_blink = now; self._dirty = True
     def draw(self, screen: pygame.Surface) -> None:
-        pygame.draw.rect(screen, UI_THEME["text_input_bg_color"], self.rect, border_radius=3)
-        border_color = UI_THEME["text_input_border_active"] if self.is_active else UI_THEME["border_color"]
+        pygame.draw.rect(screen, _TEXT_INPUT_BG_COLOR, self.rect, border_radius=3)
+        border_color = _TEXT_INPUT_BORDER_ACTIVE if self.is_active else _BORDER_COLOR
         pygame.draw.rect(screen, border_color, self.rect, 1, border_radius=3)
-        text_surf = self.font.render(self.text, True, UI_THEME["label_color"]); screen.blit(text_surf, (self.rect.x + 5, self.rect.y + 5))
+        if self.text != self._rendered_text:
+            self._rendered_surf = self.atlas.render(self.text); self._rendered_text = self.text
+        text_surf = self._rendered_surf; screen.blit(text_surf, (self.rect.x + 5, self.rect.y + 5))
         if self.is_active and self.cursor_visible:
             cursor_x = self.rect.x + 5 + text_surf.get_width(); cursor_y = self.rect.y + 5
-            pygame.draw.line(screen, UI_THEME["label_color"], (cursor_x, cursor_y), (cursor_x, cursor_y + self.font.get_height()), 1)
+            pygame.draw.line(screen, _LABEL_COLOR, (cursor_x, cursor_y), (cursor_x, cursor_y + self.font.get_height()), 1)
 
 # ==============================================================================
 # /// 3D ENGINE ///
@@ -273,6 +504,7 @@ GRASS_GREEN = (124, 252, 0)
 BLUE = (0, 0, 255)
 FPS = 60
 NEAR_CLIP_PLANE = -0.1
+LIGHT_DIRECTION = (0.36, 0.8, 0.48)  # Unit vector towards the light, fixed in world space
 
 prefixes = [
     "Player", "User", "Guest", "Anon", "Test", "Idle", "Sample",
@@ -296,6 +528,8 @@ class Network:
         self.port = port
         self.addr = (self.server_ip, self.port)
         self.player_id = None
+        self.world_cubes = None
+        self.reader, self.connected = MessageReader(), False
 
     def get_player_id(self) -> int:
         """Returns the ID assigned by the server."""
@@ -306,35 +540,83 @@ class Network:
         try:
             self.client.connect(self.addr)
             # The first piece of data received is the player ID
-            self.player_id = pickle.loads(self.client.recv(2048))
-            self.client.send(pickle.dumps(name))
+            self.player_id = recv_msg(self.client)
+            self.client.sendall(encode_name(name))
+            # The static world follows the name handshake, once per connection
+            self.world_cubes = recv_msg(self.client)['cubes']; self.connected = True
             return self.player_id
-        except socket.error as e:
+        except (socket.error, EOFError, ValueError) as e:
             print(f"Connection Error: {e}")
             return None
 
-    def send(self, data: dict) -> dict:
-        """Sends data to the server and returns the response."""
+    def send(self, position) -> Optional[dict]:
+        """Sends the player's position and returns the newest broadcast state, or None if none arrived; failures clear connected."""
         try:
-            self.client.send(pickle.dumps(data))
-            return pickle.loads(self.client.recv(2048 * 4))
-        except socket.error as e:
-            print(e)
+            self.client.sendall(encode_position(position))
+            # The server broadcasts on its own tick, so drain whatever has arrived without blocking
+            latest = None
+            while select.select([self.client], [], [], 0)[0]:
+                chunk = self.client.recv(65536)
+                if not chunk: raise EOFError("server closed the connection")
+                messages = self.reader.feed(chunk)
+                if messages: latest = messages[-1]
+            # Only the newest broadcast matters, so older ones are never decoded
+            return {'players': decode_players(latest)} if latest is not None else None
+        except (socket.error, EOFError, ValueError, struct.error) as e:
+            print(e); self.connected = False
             return None
             
     def disconnect(self): self.client.close()
 
+def aabb_bounds(position, size):
+    """Returns (min_x, max_x, min_y, max_y, min_z, max_z) for a box centred on position."""
+    x, y, z = position; hw, hh, hd = size[0] / 2, size[1] / 2, size[2] / 2
+    return (x - hw, x + hw, y - hh, y + hh, z - hd, z + hd)
+
+def shade_color(color, normal):
+    """Lambert-shades color for a face with the given unit normal."""
+    intensity = normal[0] * LIGHT_DIRECTION[0] + normal[1] * LIGHT_DIRECTION[1] + normal[2] * LIGHT_DIRECTION[2]
+    shading = max(0.1, intensity) * 0.7 + 0.3
+    return tuple(min(255, int(c * shading)) for c in color)
+
+def build_face_neighbours(faces):
+    """For each face, the index of the face sharing each of its edges (edge k runs from vertex k to k+1)."""
+    return tuple(tuple(next(j for j, other in enumerate(faces) if j != i and face[k] in other and face[(k + 1) % len(face)] in other)
+                       for k in range(len(face))) for i, face in enumerate(faces))
+
 class Cube:
+    # Corners of a unit cube and its quads, shared by every instance; corners are scaled by the half-size.
+    UNIT_VERTICES = ((-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1), (-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1))
+    faces = ((3, 2, 1, 0), (4, 5, 6, 7), (7, 3, 0, 4), (2, 6, 5, 1), (7, 6, 2, 3), (0, 1, 5, 4))
+    face_neighbours = build_face_neighbours(faces)
+    # Outward normals of the faces above; cubes never rotate, so these hold for every instance.
+    FACE_NORMALS = ((0, 0, -1), (0, 0, 1), (-1, 0, 0), (1, 0, 0), (0, 1, 0), (0, -1, 0))
     def __init__(self, position=(0, 0, 0), size=(1, 1, 1), color=WHITE):
         self.position = list(position)
         self.size = (size, size, size) if isinstance(size, (int, float)) else size
-        self.color = color
+        self._color = None; self.color = color
         sx, sy, sz = self.size[0] / 2, self.size[1] / 2, self.size[2] / 2
-        self.base_vertices = [(-sx, -sy, -sz), (sx, -sy, -sz), (sx, sy, -sz), (-sx, sy, -sz), (-sx, -sy, sz), (sx, -sy, sz), (sx, sy, sz), (-sx, sy, sz)]
-        self.faces = [(3, 2, 1, 0), (4, 5, 6, 7), (7, 3, 0, 4), (2, 6, 5, 1), (7, 6, 2, 3), (0, 1, 5, 4)]
+        self.base_vertices = tuple((x * sx, y * sy, z * sz) for x, y, z in self.UNIT_VERTICES)
+        self._verts_pos, self._verts = None, None
+    @property
+    def color(self): return self._color
+    @color.setter
+    def color(self, color):
+        # With fixed normals and a fixed light, each face's shade only changes with the colour.
+        # Player colours are reassigned every frame, so an unchanged colour keeps its shades.
+        if color == self._color: return
+        self._color = color; self.face_colors = tuple(shade_color(color, normal) for normal in self.FACE_NORMALS)
+    def facing_faces(self, eye):
+        """Which faces point towards eye: a face is visible when eye lies beyond its plane."""
+        min_x, max_x, min_y, max_y, min_z, max_z = aabb_bounds(self.position, self.size); ex, ey, ez = eye
+        return (ez < min_z, ez > max_z, ex < min_x, ex > max_x, ey > max_y, ey < min_y)
     def get_transformed_vertices(self):
-        px, py, pz = self.position
-        return [(px + x, py + y, pz + z) for x, y, z in self.base_vertices]
+        # Static cubes never move, so their world vertices are only rebuilt when the position changes.
+        pos = tuple(self.position)
+        if pos != self._verts_pos:
+            px, py, pz = pos
+            self._verts_pos, self._verts = pos, [(px + x, py + y, pz + z) for x, y, z in self.base_vertices]
+        return self._verts
 
 class Camera:
     def __init__(self, position=(0, 5, -15), yaw=-90, pitch=0):
@@ -342,28 +624,40 @@ class Camera:
         self.yaw, self.pitch = yaw, pitch
         self.target = None; self.distance, self.min_distance, self.max_distance = 15, 5, 40
         self.zoom_speed = 1.0; self.pivot_point = [0, 5, 0]; self.lerp_factor = 0.08
+        self._view_matrix, self._view_dirty = None, True
+    @property
+    def view_matrix(self):
+        """The yaw-then-pitch rotation as a 3x3 tuple of rows, rebuilt only after the angles change."""
+        if self._view_dirty:
+            rad_yaw, rad_pitch = math.radians(-self.yaw - 90), math.radians(-self.pitch)
+            cos_y, sin_y = math.cos(rad_yaw), math.sin(rad_yaw); cos_p, sin_p = math.cos(rad_pitch), math.sin(rad_pitch)
+            self._view_matrix = ((cos_y, 0.0, -sin_y), (-sin_p * sin_y, cos_p, -sin_p * cos_y), (cos_p * sin_y, sin_p, cos_p * cos_y))
+            self._view_dirty = False
+        return self._view_matrix
     def update(self, mouse_dx, mouse_dy):
         sensitivity = 0.2
-        self.yaw += mouse_dx * sensitivity
-        self.pitch -= mouse_dy * sensitivity
-        self.pitch = max(-89, min(89, self.pitch))
+        if mouse_dx or mouse_dy:
+            self.yaw += mouse_dx * sensitivity
+            self.pitch -= mouse_dy * sensitivity
+            self.pitch = max(-89, min(89, self.pitch)); self._view_dirty = True
         if self.target:
             target_pivot_y = self.target.position[1] + 2.0
             self.pivot_point[0] += (self.target.position[0] - self.pivot_point[0]) * self.lerp_factor
             self.pivot_point[1] += (target_pivot_y - self.pivot_point[1]) * self.lerp_factor
             self.pivot_point[2] += (self.target.position[2] - self.pivot_point[2]) * self.lerp_factor
             rad_yaw, rad_pitch = math.radians(self.yaw), math.radians(self.pitch)
-            offset_x = self.distance * math.cos(rad_pitch) * math.cos(rad_yaw)
+            flat_distance = self.distance * math.cos(rad_pitch)
+            offset_x = flat_distance * math.cos(rad_yaw)
             offset_y = self.distance * math.sin(rad_pitch)
-            offset_z = self.distance * math.cos(rad_pitch) * math.sin(rad_yaw)
+            offset_z = flat_distance * math.sin(rad_yaw)
             self.position = [self.pivot_point[0] - offset_x, self.pivot_point[1] - offset_y, self.pivot_point[2] - offset_z]
 
 class Engine3D:
     def __init__(self, width, height):
         pygame.init(); self.screen = pygame.display.set_mode((width, height))
         pygame.display.set_caption("3D Game"); self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont("Arial", 18)
-        self.nametag_font = pygame.font.SysFont("Arial", 14, bold=True)
+        self.font = get_font("Arial", 18)
+        self.nametag_font = get_font("Arial", 14, bold=True)
 
         self.game_state, self.running = 'main_menu', True
         self.net, self.players, self.player_id = None, {}, -1
@@ -373,23 +667,29 @@ class Engine3D:
 
         self.ui_manager = UIManager(); self._setup_main_menu()
 
-        self.gravity, self.player_y_velocity, self.is_grounded, self.jump_strength = 0.035, 0, False, 0.8
-        self.player_x_velocity, self.player_z_velocity, self.friction = 0, 0, 0.9
+        self.gravity, self.is_grounded, self.jump_strength, self.friction = 0.035, False, 0.8, 0.9
+        self.player_velocity = [0.0, 0.0, 0.0]
         self.player = Cube(position=(0, 5, 0), size=2, color=BLUE)
         self.camera = Camera(); self.camera.target = self.player; self.camera.pivot_point = list(self.player.position)
         #self.platforms = [Cube((0, -2, 0), (150, 1, 150), GRASS_GREEN), Cube((12, 2.5, 12), 5), Cube((-12, 2.5, 12), 5), Cube((0, 5, -15), (8, 1, 8))]
         
         self.static_platforms = [Cube((0, -2, 0), (150, 1, 150), GRASS_GREEN)]
         self.server_cubes = []; self.world_initialized = False
+        self._rebuild_platform_boxes()
+        # Persistent cube and collision-box proxies for the other players, keyed by player id
+        self._remote_cubes, self._remote_boxes = {}, {}
+        # Every player's name and nametag anchor as parallel lists, rebuilt once per server update
+        self._player_names, self._nametag_points = [], []
+        self._nametag_cache = {}
 
     def _setup_main_menu(self):
-        self.ui_manager.elements.clear(); cx, cy = WIDTH // 2, HEIGHT // 2
+        self.ui_manager.clear(); cx, cy = WIDTH // 2, HEIGHT // 2
         self.ui_manager.add(Label((0, cy - 150), "3D GAME", font_size=48)).rect.centerx = cx
         self.ui_manager.add(Button(pygame.Rect(cx - 150, cy - 25, 300, 50), "Multiplayer", on_click=self.show_multiplayer_menu, tooltip="Connect to a server to play with others."))
         self.ui_manager.add(Button(pygame.Rect(cx - 150, cy + 35, 300, 50), "Quit", on_click=self.quit_game, tooltip="Exit the application."))
 
     def _setup_multiplayer_menu(self):
-        self.ui_manager.elements.clear(); cx, cy = WIDTH // 2, HEIGHT // 2
+        self.ui_manager.clear(); cx, cy = WIDTH // 2, HEIGHT // 2
         self.ui_manager.add(Label((0, cy - 150), "MULTIPLAYER", font_size=32)).rect.centerx = cx
         
         self.ui_manager.add(Label((cx - 150, cy - 95), "Name:", font_size=20))
@@ -427,44 +727,69 @@ class Engine3D:
         if self.net: self.net.disconnect(); self.net = None
         self.game_state = 'main_menu'; pygame.mouse.set_visible(True); pygame.event.set_grab(False)
         self._setup_main_menu()
-        self.world_initialized = False; self.server_cubes.clear()
+        self.world_initialized = False; self.server_cubes.clear(); self._rebuild_platform_boxes()
+        self.players = {}; self._remote_cubes.clear(); self._remote_boxes.clear()
+        self._player_names, self._nametag_points = [], []
 
     def quit_game(self): self.running = False
-    def check_collision(self, c1, c2):
-        x1, y1, z1 = c1.position; w1, h1, d1 = c1.size; x2, y2, z2 = c2.position; w2, h2, d2 = c2.size
-        return (x1 - w1/2 < x2 + w2/2 and x1 + w1/2 > x2 - w2/2 and y1 - h1/2 < y2 + h2/2 and y1 + h1/2 > y2 - h2/2 and z1 - d1/2 < z2 + d2/2 and z1 + d1/2 > z2 - d2/2)
-    
-    def transform_world_to_camera_space(self, vertices):
-        transformed = []
-        for point in vertices:
-            # 1. Translate point relative to camera
-            tx, ty, tz = point[0] - self.camera.position[0], point[1] - self.camera.position[1], point[2] - self.camera.position[2]
-            # 2. Rotate point around camera
-            rad_yaw, rad_pitch = math.radians(-self.camera.yaw - 90), math.radians(-self.camera.pitch)
-            cos_y, sin_y = math.cos(rad_yaw), math.sin(rad_yaw); cos_p, sin_p = math.cos(rad_pitch), math.sin(rad_pitch)
-            x_rot = tx * cos_y - tz * sin_y; z_rot = tx * sin_y + tz * cos_y
-            y_rot = ty * cos_p - z_rot * sin_p; z_rot_pitch = ty * sin_p + z_rot * cos_p
-            transformed.append((x_rot, y_rot, z_rot_pitch))
-        return transformed
+    def _rebuild_platform_boxes(self):
+        """Precomputes the bounds of every static collider; call whenever the platform set changes."""
+        self._platform_boxes = [(aabb_bounds(p.position, p.size), p) for p in self.static_platforms + self.server_cubes]
+
+    def _sync_remote_players(self):
+        """Moves the persistent remote-player proxies to the latest server positions, adding and dropping players as needed."""
+        self._player_names = [p_data['name'] for p_data in self.players.values()]
+        self._nametag_points = [(pos[0], pos[1] + 2.0, pos[2]) for pos in (p_data['pos'] for p_data in self.players.values())]
+        for p_id, p_data in self.players.items():
+            if p_id == self.player_id: continue
+            cube = self._remote_cubes.get(p_id)
+            if cube is None: cube = self._remote_cubes[p_id] = Cube(position=p_data['pos'], size=2, color=p_data['color'])
+            else: cube.position[:] = p_data['pos']; cube.color = p_data['color']
+            self._remote_boxes[p_id] = (aabb_bounds(cube.position, cube.size), cube)
+        for p_id in (self._remote_cubes.keys() - self.players.keys()) | {self.player_id}:
+            self._remote_cubes.pop(p_id, None); self._remote_boxes.pop(p_id, None)
+
+    def _first_collision(self, boxes):
+        """Returns the first object in a list of (bounds, obj) pairs that overlaps the player, or None."""
+        x0, x1, y0, y1, z0, z1 = aabb_bounds(self.player.position, self.player.size)
+        for (min_x, max_x, min_y, max_y, min_z, max_z), obj in boxes:
+            if x0 < max_x and x1 > min_x and y0 < max_y and y1 > min_y and z0 < max_z and z1 > min_z: return obj
+        return None
+
+    def transform_world_to_camera_space(self, vertices, rotation=None, cam=None):
+        if rotation is None: rotation = self.camera.view_matrix
+        cx, cy, cz = cam if cam is not None else self.camera.position
+        (r00, _, r02), (r10, r11, r12), (r20, r21, r22) = rotation
+        return [(r00 * tx + r02 * tz, r10 * tx + r11 * ty + r12 * tz, r20 * tx + r21 * ty + r22 * tz)
+                for tx, ty, tz in ((x - cx, y - cy, z - cz) for x, y, z in vertices)]
 
     def project_point(self, x, y, z):
         if z >= 0: return None
         factor = 400 / -z; return (int(x * factor + WIDTH / 2), int(-y * factor + HEIGHT / 2))
+    def project_points(self, verts):
+        """Projects camera-space points already known to lie in front of the near plane."""
+        half_w, half_h = WIDTH / 2, HEIGHT / 2
+        return [(int(x * (400 / -z) + half_w), int(-y * (400 / -z) + half_h)) for x, y, z in verts]
+    def outside_frustum(self, verts):
+        """True when every camera-space vertex is beyond the same frustum plane, so nothing of the object can reach the screen."""
+        half_w, half_h, near = WIDTH / 2 / 400, HEIGHT / 2 / 400, NEAR_CLIP_PLANE
+        return (all(z >= near for _, _, z in verts) or all(x < half_w * z for x, _, z in verts) or all(x > -half_w * z for x, _, z in verts)
+                or all(y > -half_h * z for _, y, z in verts) or all(y < half_h * z for _, y, z in verts))
     def clip_against_near_plane(self, poly_verts):
-        clipped = [];
-        for i in range(len(poly_verts)):
-            p1, p2 = poly_verts[i], poly_verts[(i + 1) % len(poly_verts)]; p1_in, p2_in = p1[2] < NEAR_CLIP_PLANE, p2[2] < NEAR_CLIP_PLANE
+        clipped = []; near = NEAR_CLIP_PLANE
+        for (x1, y1, z1), p2 in zip(poly_verts, poly_verts[1:] + poly_verts[:1]):
+            x2, y2, z2 = p2; p1_in, p2_in = z1 < near, z2 < near
             if p1_in and p2_in: clipped.append(p2)
             elif p1_in or p2_in:
-                if p2[2] - p1[2] == 0: continue
-                t = (NEAR_CLIP_PLANE - p1[2]) / (p2[2] - p1[2]); ix, iy = p1[0] + t * (p2[0] - p1[0]), p1[1] + t * (p2[1] - p1[1])
-                if p1_in: clipped.append((ix, iy, NEAR_CLIP_PLANE))
-                else: clipped.extend([(ix, iy, NEAR_CLIP_PLANE), p2])
+                if z2 - z1 == 0: continue
+                t = (near - z1) / (z2 - z1); ix, iy = x1 + t * (x2 - x1), y1 + t * (y2 - y1)
+                if p1_in: clipped.append((ix, iy, near))
+                else: clipped.append((ix, iy, near)); clipped.append(p2)
         return clipped
     
     def _handle_game_input(self, event):
         if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE and self.is_grounded: self.player_y_velocity = self.jump_strength; self.is_grounded = False
+            if event.key == pygame.K_SPACE and self.is_grounded: self.player_velocity[1] = self.jump_strength; self.is_grounded = False
             elif event.key == pygame.K_ESCAPE: self.return_to_menu()
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 4: self.camera.distance -= self.camera.zoom_speed
@@ -474,111 +799,89 @@ class Engine3D:
         keys = pygame.key.get_pressed(); mouse_dx, mouse_dy = pygame.mouse.get_rel(); self.camera.update(mouse_dx, mouse_dy)
         self.camera.distance = max(self.camera.min_distance, min(self.camera.max_distance, self.camera.distance))
         accel = 0.05; rad_yaw = math.radians(self.camera.yaw)
-        if keys[pygame.K_w]: self.player_x_velocity += math.cos(rad_yaw) * accel; self.player_z_velocity += math.sin(rad_yaw) * accel
-        if keys[pygame.K_s]: self.player_x_velocity -= math.cos(rad_yaw) * accel; self.player_z_velocity -= math.sin(rad_yaw) * accel
-        if keys[pygame.K_a]: self.player_x_velocity += math.sin(rad_yaw) * accel; self.player_z_velocity -= math.cos(rad_yaw) * accel
-        if keys[pygame.K_d]: self.player_x_velocity -= math.sin(rad_yaw) * accel; self.player_z_velocity += math.cos(rad_yaw) * accel
-        self.player_x_velocity *= self.friction; self.player_z_velocity *= self.friction
-        if abs(self.player_x_velocity) < 0.001: self.player_x_velocity = 0
-        if abs(self.player_z_velocity) < 0.001: self.player_z_velocity = 0
-        old_x, old_z = self.player.position[0], self.player.position[2]
-        all_platforms = self.static_platforms + self.server_cubes
-        self.player.position[0] += self.player_x_velocity
-        for p in all_platforms:
-            if self.check_collision(self.player, p): self.player.position[0] = old_x; self.player_x_velocity = 0; break
-        
-        if self.game_state == 'in_game_multiplayer':
-            for p_id, p_data in self.players.items():
-                if p_id != self.player_id:
-                    other_player_cube = Cube(position=p_data['pos'], size=self.player.size)
-                    if self.check_collision(self.player, other_player_cube):
-                        self.player.position[0] = old_x
-                        self.player_x_velocity = 0
-                        break
-            
-        self.player.position[2] += self.player_z_velocity
-        for p in all_platforms:
-            if self.check_collision(self.player, p): self.player.position[2] = old_z; self.player_z_velocity = 0; break
-        
-        if self.game_state == 'in_game_multiplayer':
-            for p_id, p_data in self.players.items():
-                if p_id != self.player_id:
-                    other_player_cube = Cube(position=p_data['pos'], size=self.player.size)
-                    if self.check_collision(self.player, other_player_cube):
-                        self.player.position[2] = old_z
-                        self.player_z_velocity = 0
-                        break
-        
-        self.player_y_velocity -= self.gravity; self.player.position[1] += self.player_y_velocity
-        self.is_grounded = False
-        for p in all_platforms:
-            if self.check_collision(self.player, p):
-                if self.player_y_velocity <= 0:
-                    self.player.position[1] = p.position[1] + p.size[1]/2 + self.player.size[1]/2; self.player_y_velocity = 0; self.is_grounded = True
-                else:
-                    self.player.position[1] = p.position[1] - p.size[1]/2 - self.player.size[1]/2; self.player_y_velocity = 0
-                break
-        
-        if self.game_state == 'in_game_multiplayer':
-            for p_id, p_data in self.players.items():
-                if p_id != self.player_id:
-                    other_player_cube = Cube(position=p_data['pos'], size=self.player.size)
-                    if self.check_collision(self.player, other_player_cube):
-                        if self.player_y_velocity <= 0:
-                            self.player.position[1] = other_player_cube.position[1] + other_player_cube.size[1]/2 + self.player.size[1]/2
-                            self.player_y_velocity = 0
-                            self.is_grounded = True
-                        else:
-                            self.player.position[1] = other_player_cube.position[1] - other_player_cube.size[1]/2 - self.player.size[1]/2
-                            self.player_y_velocity = 0
-                        break
+        cos_a, sin_a = math.cos(rad_yaw) * accel, math.sin(rad_yaw) * accel
+        vel, pos = self.player_velocity, self.player.position
+        if keys[pygame.K_w]: vel[0] += cos_a; vel[2] += sin_a
+        if keys[pygame.K_s]: vel[0] -= cos_a; vel[2] -= sin_a
+        if keys[pygame.K_a]: vel[0] += sin_a; vel[2] -= cos_a
+        if keys[pygame.K_d]: vel[0] -= sin_a; vel[2] += cos_a
+        other_players = list(self._remote_boxes.values()) if self.game_state == 'in_game_multiplayer' else []
+        # Axis-separated resolution: a blocked horizontal axis just reverts that component
+        boxes = self._platform_boxes + other_players
+        for axis in (0, 2):
+            vel[axis] *= self.friction
+            if abs(vel[axis]) < 0.001: vel[axis] = 0
+            old = pos[axis]; pos[axis] += vel[axis]
+            if self._first_collision(boxes) is not None: pos[axis] = old; vel[axis] = 0
+
+        vel[1] -= self.gravity; pos[1] += vel[1]
+        self.is_grounded = False; half_height = self.player.size[1] / 2
+        # Platforms resolve first, then other players against the corrected height
+        for group in (self._platform_boxes, other_players):
+            hit = self._first_collision(group)
+            if hit is None: continue
+            if vel[1] <= 0: pos[1] = hit.position[1] + hit.size[1]/2 + half_height; self.is_grounded = True
+            else: pos[1] = hit.position[1] - hit.size[1]/2 - half_height
+            vel[1] = 0
 
     def _draw_scene(self, objects_to_draw):
         self.screen.fill(BLACK); all_faces = []
+        rotation, cam = self.camera.view_matrix, tuple(self.camera.position)
+        # Transform every object's vertices in one batch, then walk each object's slice of the result.
+        world_verts = [v for obj in objects_to_draw for v in obj.get_transformed_vertices()]
+        cam_verts = self.transform_world_to_camera_space(world_verts, rotation, cam); offset = 0
+        # Cull, clip and project each face in a single pass so rejected faces are never sorted.
         for obj in objects_to_draw:
-            cam_space_verts = self.transform_world_to_camera_space(obj.get_transformed_vertices())
-            for face_indices in obj.faces:
-                face_verts = [cam_space_verts[i] for i in face_indices]
-                if face_verts: all_faces.append({"depth": min(v[2] for v in face_verts), "verts": face_verts, "color": obj.color})
-        all_faces.sort(key=lambda f: f["depth"])
-        for face in all_faces:
-            v0, v1, v2 = face["verts"][0], face["verts"][1], face["verts"][2]
-            vec1 = (v1[0]-v0[0], v1[1]-v0[1], v1[2]-v0[2]); vec2 = (v2[0]-v0[0], v2[1]-v0[1], v2[2]-v0[2])
-            nx, ny, nz = vec1[1]*vec2[2] - vec1[2]*vec2[1], vec1[2]*vec2[0] - vec1[0]*vec2[2], vec1[0]*vec2[1] - vec1[1]*vec2[0]
-            if (nx*v0[0] + ny*v0[1] + nz*v0[2]) >= 0: continue
-            clipped_face = self.clip_against_near_plane(face["verts"]);
-            if len(clipped_face) < 3: continue
-            projected = [self.project_point(*v) for v in clipped_face];
-            if None in projected: continue
-            mag = math.sqrt(nx**2+ny**2+nz**2);
-            if mag == 0: continue
-            light = (0.577, -0.577, -0.577); intensity = (nx/mag * light[0] + ny/mag * light[1] + nz/mag * light[2])
-            shading = max(0.1, intensity) * 0.7 + 0.3; shaded_color = tuple(min(255, int(c * shading)) for c in face["color"])
+            verts = cam_verts[offset:offset + len(obj.base_vertices)]; offset += len(verts)
+            if self.outside_frustum(verts): continue
+            # Back-face test every face first so each visible face knows which of its edges are silhouette edges.
+            front = [[verts[i] for i in face_indices] if facing else None for face_indices, facing in zip(obj.faces, obj.facing_faces(cam))]
+            # Most objects lie wholly in front of the near plane; only the rest need per-face behind/straddle tests.
+            straddles = max(z for _, _, z in verts) >= NEAR_CLIP_PLANE
+            for face_index, face_verts in enumerate(front):
+                if face_verts is None: continue
+                (_, _, z0), (_, _, z1), (_, _, z2), (_, _, z3) = face_verts
+                depth, clipped = min(z0, z1, z2, z3), False
+                if straddles:
+                    if depth >= NEAR_CLIP_PLANE: continue
+                    clipped = max(z0, z1, z2, z3) >= NEAR_CLIP_PLANE
+                    if clipped:
+                        # Only faces straddling the near plane take the clipping path.
+                        face_verts = self.clip_against_near_plane(face_verts)
+                        if len(face_verts) < 3: continue
+                projected = self.project_points(face_verts)
+                # Clipping renumbers the vertices, so a clipped face falls back to a full outline (None).
+                edges = None if clipped else [(projected[k], projected[(k + 1) % 4]) for k, neighbour in enumerate(obj.face_neighbours[face_index]) if front[neighbour] is None]
+                all_faces.append((depth, projected, obj.face_colors[face_index], edges))
+        all_faces.sort(key=itemgetter(0))
+        for _, projected, shaded_color, edges in all_faces:
+            # draw.polygon clips to the surface; gfxdraw's 16-bit coordinates wrap on near-plane-clipped faces
             pygame.draw.polygon(self.screen, shaded_color, projected)
-            pygame.draw.polygon(self.screen, BLACK, projected, 1)
+            if edges is None: pygame.draw.polygon(self.screen, BLACK, projected, 1)
+            else:
+                for start, end in edges: pygame.draw.line(self.screen, BLACK, start, end)
 
     def _draw_nametags(self):
-        for p_id, p_data in self.players.items():
-            # Define the 3D position for the nametag (above the player's cube)
-            pos3d = p_data['pos']
-            name = p_data['name']
-            nametag_world_pos = [(pos3d[0], pos3d[1] + 2.0, pos3d[2])]
-
-            # Transform this 3D point into camera space
-            nametag_camera_pos = self.transform_world_to_camera_space(nametag_world_pos)[0]
-
+        # Transform every nametag anchor (2 units above each player's cube) into camera space in one batch
+        nametag_camera_points = self.transform_world_to_camera_space(self._nametag_points)
+        for name, nametag_camera_pos in zip(self._player_names, nametag_camera_points):
             # Project the camera-space point to 2D screen coordinates
             screen_pos = self.project_point(*nametag_camera_pos)
             
             # Only draw if the point is on screen
             if screen_pos:
-                text_surf = self.nametag_font.render(name, True, WHITE)
+                # Names almost never change, so the text and its background are rendered once per name
+                cached = self._nametag_cache.get(name)
+                if cached is None:
+                    text_surf = self.nametag_font.render(name, True, WHITE)
+                    bg_surf = pygame.Surface(text_surf.get_rect().inflate(8, 4).size, pygame.SRCALPHA)
+                    bg_surf.fill((20, 20, 40, 150))
+                    cached = self._nametag_cache[name] = (text_surf, bg_surf)
+                text_surf, bg_surf = cached
                 text_rect = text_surf.get_rect(center=screen_pos)
                 
                 # Draw a semi-transparent background for readability
                 bg_rect = text_rect.inflate(8, 4)
-                bg_surf = pygame.Surface(bg_rect.size, pygame.SRCALPHA)
-                bg_surf.fill((20, 20, 40, 150))
                 self.screen.blit(bg_surf, bg_rect)
                 
                 self.screen.blit(text_surf, text_rect)
@@ -586,37 +889,35 @@ class Engine3D:
     def run(self):
         while self.running:
             self.clock.tick(FPS); events = pygame.event.get()
+            in_game = self.game_state.startswith('in_game')
             for event in events:
                 if event.type == pygame.QUIT: self.running = False
-                if self.game_state.startswith('in_game'): self._handle_game_input(event)
-                else: self.ui_manager.handle_events(event)
+                if in_game: self._handle_game_input(event)
+            if not in_game: self.ui_manager.pump(events)
             
             if self.game_state in ['main_menu', 'multiplayer_menu']:
-                self.ui_manager.update(); self.screen.fill((10, 20, 30)); self.ui_manager.draw(self.screen)
+                self.ui_manager.update(); pygame.display.update(self.ui_manager.draw(self.screen, background=(10, 20, 30)))
             
             elif self.game_state == 'in_game_multiplayer':
                 self._update_physics_and_input()
                 if self.net:
-                    server_response = self.net.send({'pos': self.player.position})
-                    if server_response:
-                        self.players = server_response.get('players', {})
+                    server_response = self.net.send(self.player.position)
+                    if not self.net.connected:
+                        print("Connection to server lost."); self.return_to_menu()
+                    elif server_response is not None:
+                        self.players = server_response.get('players', {}); self._sync_remote_players()
                         
-                        if not self.world_initialized and 'cubes' in server_response:
+                        if not self.world_initialized and self.net.world_cubes is not None:
                             self.server_cubes.clear()
-                            for cube_data in server_response['cubes']:
+                            for cube_data in self.net.world_cubes:
                                 self.server_cubes.append(Cube(
                                     position=cube_data['pos'],
                                     size=cube_data['size'],
                                     color=cube_data['color']
                                 ))
-                            self.world_initialized = True
-                    else:
-                        print("Connection to server lost."); self.return_to_menu()
+                            self.world_initialized = True; self._rebuild_platform_boxes()
                 
-                multiplayer_objects = self.static_platforms + self.server_cubes
-                for p_id, p_data in self.players.items():
-                    if p_id != self.player_id:
-                        multiplayer_objects.append(Cube(position=p_data['pos'], size=2, color=p_data['color']))
+                multiplayer_objects = self.static_platforms + self.server_cubes + list(self._remote_cubes.values())
                 
                 if self.player_id in self.players: self.player.color = self.players[self.player_id]['color']
                 multiplayer_objects.append(self.player)
@@ -627,8 +928,7 @@ class Engine3D:
                 my_name = self.players.get(self.player_id, {}).get('name', '')
                 info_text = self.font.render(f"Connected as {my_name} | Exit: ESC", True, WHITE)
                 self.screen.blit(info_text, (10, 10))
-
-            pygame.display.flip()
+                pygame.display.flip()
 
         pygame.quit(); sys.exit()
 
@@ -0,0 +1,101 @@
+import pickle
+import socket
+import struct
+
+# ==============================================================================
+"""
+Wire framing shared by the game client (engine.py) and server.py.
+
+Every message is a 4-byte big-endian length followed by that many bytes of
+payload, so a message is always read in full no matter how TCP splits it up.
+
+The one-off handshake (player ID and world) is pickled; the per-frame traffic
+uses fixed struct layouts instead:
+  up:   x y z as three float32
+  down: uint16 player count, then per player
+        id:u32 r:u8 g:u8 b:u8 x:f32 y:f32 z:f32 name_len:u8 name:utf-8
+"""
+HEADER = struct.Struct("!I")
+# Fixed rather than HIGHEST_PROTOCOL so client and server agree across Python versions (3.8+).
+PICKLE_PROTOCOL = 5
+# Far above any real payload; a larger length header means a broken or hostile peer.
+MAX_FRAME = 1 << 20
+POSITION = struct.Struct("!3f")
+PLAYER_COUNT = struct.Struct("!H")
+PLAYER_ENTRY = struct.Struct("!I3B3fB")
+
+def encode_frame(payload: bytes) -> bytes:
+    """Prepends the length header to an already encoded payload."""
+    return HEADER.pack(len(payload)) + payload
+
+def encode_msg(obj) -> bytes:
+    """Pickles obj and prepends its length header."""
+    return encode_frame(pickle.dumps(obj, protocol=PICKLE_PROTOCOL))
+
+def encode_name(name: str) -> bytes:
+    """Frames a player name as UTF-8, cut to the 255 bytes a name_len can describe."""
+    return encode_frame(name.encode("utf-8")[:255])
+
+def decode_name(payload) -> str:
+    """Decodes a name frame, dropping any character the 255-byte cut split."""
+    return bytes(payload).decode("utf-8", "ignore")
+
+def encode_position(position) -> bytes:
+    """Frames a position update as three float32s."""
+    return encode_frame(POSITION.pack(*position))
+
+def decode_position(payload) -> list:
+    """Unpacks a position frame; raises struct.error if it isn't exactly three float32s."""
+    return list(POSITION.unpack(payload))
+
+def encode_players(players: dict) -> bytes:
+    """Frames every player's id, color, position and name in one buffer."""
+    buf = bytearray(PLAYER_COUNT.pack(len(players)))
+    for player_id, p_data in players.items():
+        name = p_data['name'].encode("utf-8")[:255]
+        buf += PLAYER_ENTRY.pack(player_id, *p_data['color'], *p_data['pos'], len(name)); buf += name
+    return encode_frame(buf)
+
+def decode_players(payload) -> dict:
+    """Inverse of encode_players: {id: {'pos', 'color', 'name'}}."""
+    (count,), offset, players = PLAYER_COUNT.unpack_from(payload), PLAYER_COUNT.size, {}
+    for _ in range(count):
+        player_id, r, g, b, x, y, z, name_len = PLAYER_ENTRY.unpack_from(payload, offset)
+        offset += PLAYER_ENTRY.size
+        name = bytes(payload[offset:offset + name_len]).decode("utf-8", "ignore"); offset += name_len
+        players[player_id] = {'pos': [x, y, z], 'color': (r, g, b), 'name': name}
+    return players
+
+def recv_exact(sock: socket.socket, n: int) -> bytearray:
+    """Reads exactly n bytes into one preallocated buffer; raises EOFError if the peer closes first."""
+    buf = bytearray(n); view = memoryview(buf); received = 0
+    while received < n:
+        count = sock.recv_into(view[received:], n - received)
+        if count == 0: raise EOFError("connection closed mid-message")
+        received += count
+    return buf
+
+def check_length(length: int) -> int:
+    """Returns length, raising ValueError if it exceeds MAX_FRAME."""
+    if length > MAX_FRAME: raise ValueError(f"frame of {length} bytes exceeds MAX_FRAME")
+    return length
+
+def recv_msg(sock: socket.socket):
+    """Reads one length-prefixed message and unpickles it."""
+    length = check_length(HEADER.unpack(recv_exact(sock, HEADER.size))[0])
+    return pickle.loads(recv_exact(sock, length))
+
+class MessageReader:
+    """Reassembles framed payloads from the arbitrary chunks a non-blocking socket hands back."""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        """Appends newly received bytes and returns the raw payload of every message now complete; raises ValueError on an oversized header."""
+        self.buffer += data; messages = []
+        while len(self.buffer) >= HEADER.size:
+            length = check_length(HEADER.unpack_from(self.buffer)[0])
+            end = HEADER.size + length
+            if len(self.buffer) < end: break
+            messages.append(bytes(self.buffer[HEADER.size:end])); del self.buffer[:end]
+        return messages
@@ -1,11 +1,14 @@
 import socket
-from _thread import *
-import pickle
+import selectors
+import time
+import struct
 import random
+from protocol import encode_msg, decode_name, decode_position, encode_players, MessageReader
 
 # --- Server Configuration ---
 server_ip = "127.0.0.1" 
 port = 5555
+broadcast_interval = 1 / 30
 
 # --- Server Setup ---
 s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -21,6 +24,8 @@ GRASS_GREEN = (124, 252, 0)
 players = {}
 player_id_counter = 1
 world_cubes = []
+selector = selectors.DefaultSelector()
+connections = {}
 
 def generate_random_world_cubes(count=30):
     """
@@ -46,64 +51,152 @@ def generate_random_world_cubes(count=30):
         world_cubes.append({'pos': (px, py, pz), 'size': size, 'color': color})
 
 # --- Main Server Logic ---
-def threaded_client(conn: socket.socket, player_id: int):
+class ClientConnection:
     """
-    Handles communication with a single client in its own thread.
+    Per-socket state for one client: its player ID, partial reads and unsent bytes.
     """
-    global players
-    
-    # 1. Send the new player their assigned ID
-    conn.send(pickle.dumps(player_id))
-    
-    # 2. Receive the player's name from the client
+    def __init__(self, conn: socket.socket, player_id: int):
+        self.conn = conn
+        self.player_id = player_id
+        self.name = None
+        self.reader = MessageReader()
+        self.outbox = bytearray()
+        # Offset of the newest broadcast in the outbox while none of it has been sent yet, else None
+        self.broadcast_start = None
+
+def queue_message(client: ClientConnection, obj) -> None:
+    """Queues a framed message for the client and tries to send it straight away."""
+    client.outbox += encode_msg(obj)
+    client.broadcast_start = None
+    flush(client)
+
+def flush(client: ClientConnection) -> None:
+    """Sends as much of the outbox as the socket takes, watching for writability while bytes remain."""
     try:
-        player_name = pickle.loads(conn.recv(2048))
-    except (pickle.UnpicklingError, EOFError):
-        print(f"Player {player_id} failed to send name. Disconnecting.")
-        conn.close()
+        sent = client.conn.send(client.outbox)
+        del client.outbox[:sent]
+        if client.broadcast_start is not None:
+            client.broadcast_start -= sent
+            if client.broadcast_start < 0:
+                client.broadcast_start = None
+    except BlockingIOError:
+        pass
+    except ConnectionError:
+        disconnect(client)
+        return
+    events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbox else 0)
+    if selector.get_key(client.conn).events != events:
+        selector.modify(client.conn, events, client)
+
+def accept_client(server_sock: socket.socket) -> None:
+    """
+    Accepts a new connection and sends the player their assigned ID.
+    """
+    global player_id_counter
+    conn, addr = server_sock.accept()
+    print(f"New connection from: {addr}")
+    conn.setblocking(False)
+    client = ClientConnection(conn, player_id_counter)
+    player_id_counter += 1
+    selector.register(conn, selectors.EVENT_READ, client)
+    connections[client.player_id] = client
+    queue_message(client, client.player_id)
+
+def handle_message(client: ClientConnection, data) -> None:
+    """
+    Handles one message: the first is the player's name, every later one a position update.
+    """
+    player_id = client.player_id
+    if client.name is None:
+        # Create the initial state for the new player
+        client.name = decode_name(data)
+        player_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+        players[player_id] = {'pos': [0, 5, 0], 'color': player_color, 'name': client.name}
+        print(f"Player '{client.name}' (ID: {player_id}) connected.")
+        # The world never changes after startup, so it is sent once here rather than with every update
+        queue_message(client, {'cubes': world_cubes})
         return
 
-    # 3. Create the initial state for the new player
-    player_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-    players[player_id] = {'pos': [0, 5, 0], 'color': player_color, 'name': player_name}
-    print(f"Player '{player_name}' (ID: {player_id}) connected.")
+    # Update this player's state on the server; everyone receives it with the next broadcast
+    players[player_id]['pos'] = decode_position(data)
 
-    # 4. Main loop to receive updates from client and send back the world state
-    while True:
-        try:
-            # Receive the client's current position data
-            data = pickle.loads(conn.recv(2048))
-            
-            # Update this player's state on the server
-            players[player_id]['pos'] = data['pos']
-
-            if not data:
-                break
-            
-            # <<< MODIFIED: Send back a dictionary containing BOTH players and world cubes
-            reply = {
-                'players': players,
-                'cubes': world_cubes
-            }
-            conn.sendall(pickle.dumps(reply))
-
-        except (pickle.UnpicklingError, ConnectionResetError, EOFError):
+def handle_readable(client: ClientConnection) -> None:
+    """Reads whatever has arrived and handles each message it completes."""
+    try:
+        data = client.conn.recv(4096)
+    except BlockingIOError:
+        return
+    except ConnectionError:
+        data = b""
+    if not data:
+        disconnect(client)
+        return
+    try:
+        messages = client.reader.feed(data)
+    except ValueError:
+        # An oversized length header would otherwise make the server buffer without bound
+        disconnect(client)
+        return
+    for message in messages:
+        if client.conn.fileno() == -1:
             break
-            
-    # 5. Cleanup when a player disconnects
-    print(f"Player '{players.get(player_id, {}).get('name', 'Unknown')}' (ID: {player_id}) disconnected.")
-    if player_id in players:
-        del players[player_id]
-    conn.close()
+        try:
+            handle_message(client, message)
+        except struct.error:
+            # A frame that doesn't match the fixed layout means the client is out of sync
+            disconnect(client)
+
+def disconnect(client: ClientConnection) -> None:
+    """
+    Cleanup when a player disconnects.
+    """
+    if client.conn.fileno() == -1:
+        return
+    if client.name is None:
+        print(f"Player {client.player_id} failed to send name. Disconnecting.")
+    else:
+        print(f"Player '{players.get(client.player_id, {}).get('name', 'Unknown')}' (ID: {client.player_id}) disconnected.")
+    players.pop(client.player_id, None)
+    connections.pop(client.player_id, None)
+    selector.unregister(client.conn)
+    client.conn.close()
+
+def broadcast_players() -> None:
+    """
+    Packs the player states once and queues the same bytes for every named client.
+    Only the latest state matters, so a broadcast still wholly unsent is replaced
+    rather than appended to; a client that stops reading can't grow its outbox.
+    """
+    payload = encode_players(players)
+    for client in list(connections.values()):
+        if client.name is not None:
+            if client.broadcast_start is not None:
+                del client.outbox[client.broadcast_start:]
+            client.broadcast_start = len(client.outbox)
+            client.outbox += payload
+            flush(client)
 
 # --- Main Server Loop ---
 generate_random_world_cubes()
 s.listen()
+s.setblocking(False)
+selector.register(s, selectors.EVENT_READ, None)
 print(f"Server Started. Listening on {server_ip}:{port}")
 
+# A single thread multiplexes every client socket instead of one thread per client
+next_broadcast = time.monotonic()
 while True:
-    conn, addr = s.accept()
-    print(f"New connection from: {addr}")
-    
-    start_new_thread(threaded_client, (conn, player_id_counter))
-    player_id_counter += 1
\ No newline at end of file
+    for key, mask in selector.select(max(0.0, next_broadcast - time.monotonic())):
+        if key.data is None:
+            accept_client(key.fileobj)
+            continue
+        client = key.data
+        if mask & selectors.EVENT_READ:
+            handle_readable(client)
+        if mask & selectors.EVENT_WRITE and client.conn.fileno() != -1:
+            flush(client)
+    if time.monotonic() >= next_broadcast:
+        broadcast_players()
+        next_broadcast += broadcast_interval
+        # Don't try to catch up on ticks missed while the loop was stalled
+        next_broadcast = max(next_broadcast, time.monotonic())
\ No newline at end of file